@@ -13,14 +13,34 @@ BOT_TOKEN: str = os.getenv("BOT_TOKEN")
 
 env_user_ids = os.getenv("ALLOWED_USER_IDS")
 if env_user_ids:
-    # Parse comma-separated string from environment variable
+    # Parse comma-separated string from environment variable.
+    # A frozenset makes the per-update authorization check a single hash lookup.
     try:
-        ALLOWED_USER_IDS: list[int] = [int(uid.strip()) for uid in env_user_ids.split(',')]
+        ALLOWED_USER_IDS: frozenset[int] = frozenset(int(uid.strip()) for uid in env_user_ids.split(','))
     except ValueError:
         raise ValueError("Invalid format for ALLOWED_USER_IDS in environment. Must be comma-separated integers.")
 else:
     # Default value if not set in environment
-    ALLOWED_USER_IDS: list[int] = []
+    ALLOWED_USER_IDS: frozenset[int] = frozenset()
+
+# --- Telegram HTTP Connection Pools ---
+# Pool for regular API calls (replies, keyboard edits, documents). A handful of
+# authorized users never needs more than a few dozen concurrent requests; the
+# longer pool timeout lets bursts of button presses queue instead of failing
+# with "All connections in the connection pool are occupied" (PTB waits 1s).
+CONNECTION_POOL_SIZE: int = 32
+POOL_TIMEOUT: float = 20.0 # Seconds to wait for a free connection
+CONNECT_TIMEOUT: float = 10.0
+READ_TIMEOUT: float = 20.0
+# Separate pool used only by getUpdates long polling
+GET_UPDATES_CONNECTION_POOL_SIZE: int = 4
+GET_UPDATES_POOL_TIMEOUT: float = 30.0
+
+# --- Rate Limiting ---
+# Retries of a request that Telegram answered with 429 (RetryAfter)
+RATE_LIMITER_MAX_RETRIES: int = 3
+# Seconds to wait for further toggles before editing the attendance keyboard
+KEYBOARD_EDIT_DEBOUNCE: float = 0.1
 
 # --- File Paths ---
 # Ensure these paths are relative to the project root or use absolute paths
@@ -28,6 +48,8 @@ else:
 DATA_DIR: str = "data"
 GROUPS_EXCEL_FILE: str = os.path.join(DATA_DIR, "groups.xlsx")
 ATTENDANCE_JSON_FILE: str = os.path.join(DATA_DIR, "attendance.json")
+# Append-only log of marks made since the last attendance snapshot
+ATTENDANCE_WAL_FILE: str = ATTENDANCE_JSON_FILE + ".wal"
 REPORTS_DIR: str = os.path.join(DATA_DIR, "reports") # Directory for generated reports
 
 # --- Error Handling ---
@@ -37,6 +59,10 @@ UNAUTHORIZED_MESSAGE: str = "Извините, этот бот предназн
 # --- Input Validation ---
 MAX_REPORT_DAYS: int = 365 # Maximum number of days for the report
 
+# --- Persistence ---
+ATTENDANCE_WAL_COMPACT_LINES: int = 10000 # Rewrite the snapshot once the log grows this long
+ATTENDANCE_FLUSH_DELAY: float = 2.0 # Seconds to batch marks before writing a snapshot in the background
+
 # --- Excel Structure ---
 # Define the expected column names in the uploaded Excel file
 EXCEL_GROUP_COLUMN: str = "Группа"
@@ -52,4 +78,4 @@ def validate_config() -> None:
         raise ValueError("Bot token is not set in config.py or environment variables.")
     if not ALLOWED_USER_IDS:
         raise ValueError("Allowed user IDs list is empty in config.py or environment variables.")
-    print(f"Configuration loaded. Allowed user IDs: {ALLOWED_USER_IDS}")
+    print(f"Configuration loaded. Allowed user IDs: {sorted(ALLOWED_USER_IDS)}")
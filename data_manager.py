@@ -4,14 +4,23 @@ Manages loading, saving, and accessing group and attendance data.
 Uses Excel for group definitions and JSON for attendance records.
 """
 
-import json
+import asyncio
+import functools
 import logging
 import os
+import pickle
+import sys
+import threading
 from collections import defaultdict
 from datetime import date, timedelta
-from typing import Dict, List, Set, Optional, Tuple
+from itertools import groupby
+from operator import itemgetter
+from typing import BinaryIO, Dict, FrozenSet, List, Set, Optional, Tuple
 
-import pandas as pd
+import numpy as np
+import orjson
+import xlsxwriter
+from openpyxl import load_workbook
 
 import config
 import utils
@@ -23,17 +32,42 @@ AttendanceData = Dict[str, Dict[str, Set[str]]]
 # Type alias for group data: { 'Group Name': ['Child1', 'Child2'] }
 GroupData = Dict[str, List[str]]
 
+# Operation codes stored in the attendance write-ahead log
+WAL_MARK = '+'
+WAL_UNMARK = '-'
+
+# Suffix of the pickle sidecar that caches the parsed groups next to the Excel file
+GROUPS_CACHE_SUFFIX = ".cache.pkl"
+
 
 class DataManager:
     """Handles all data operations for groups and attendance."""
 
+    # A single long-lived instance, so skip the per-instance __dict__
+    __slots__ = ('groups', '_attendance', '_sorted_groups', '_groups_set', '_wal', '_wal_lines',
+                 '_attendance_rev', '_report_cache', '_dirty', '_flush_handle', '_flush_future',
+                 '_snapshot_lock', '_snapshot_rev', '_last_save_ok')
+
     def __init__(self) -> None:
         """Initializes the DataManager, ensuring data directories exist."""
         self.groups: GroupData = {}
-        self.attendance: AttendanceData = defaultdict(lambda: defaultdict(set))
+        self._sorted_groups: Tuple[str, ...] = ()
+        self._groups_set: Dict[str, FrozenSet[str]] = {}
+        self._attendance: Optional[AttendanceData] = None # Loaded on first access, see `attendance`
+        self._wal: Optional[BinaryIO] = None # Opened lazily on the first logged change
+        self._wal_lines = 0
+        # Bumped on every attendance change; part of the report cache key
+        self._attendance_rev = 0
+        self._report_cache: Dict[int, Tuple[str, int, str]] = {} # days -> (date, rev, path)
+        # Background snapshot state, see _schedule_flush
+        self._dirty = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_future: Optional[asyncio.Future] = None
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_rev = -1 # Revision of the newest snapshot on disk
+        self._last_save_ok = True # Outcome of the most recent snapshot write
         self._ensure_data_files_exist()
         self.load_groups_from_excel()
-        self.load_attendance()
 
     def _ensure_data_files_exist(self) -> None:
         """Creates data directories and initial empty files if they don't exist."""
@@ -54,109 +88,390 @@ class DataManager:
         Returns:
             Tuple[bool, str]: (success_status, message)
         """
+        success, message, groups = self.read_groups_from_excel(file_path)
+        if groups is not None:
+            self.set_groups(groups)
+        return success, message
+
+    def read_groups_from_excel(
+        self, file_path: str = config.GROUPS_EXCEL_FILE
+    ) -> Tuple[bool, str, Optional[GroupData]]:
+        """
+        Parses group and child data from the specified Excel file without touching
+        the loaded groups, so it can run in a worker thread. Apply the result with
+        set_groups on the thread that serves the handlers.
+
+        Args:
+            file_path: Path to the Excel file. Defaults to config.GROUPS_EXCEL_FILE.
+
+        Returns:
+            Tuple[bool, str, Optional[GroupData]]: (success_status, message, groups),
+            where groups is None if the current groups should be kept.
+        """
         if not os.path.exists(file_path):
             logger.warning("Groups Excel file not found at %s. No groups loaded.", file_path)
-            self.groups = {} # Ensure groups are empty if file is missing
-            return True, "Файл с группами еще не загружен." # Not an error, just state
+            return True, "Файл с группами еще не загружен.", {} # Not an error, just state
+
+        file_stat = os.stat(file_path)
+        cached_groups = self._load_groups_cache(file_path, file_stat)
+        if cached_groups is not None:
+            groups = {sys.intern(group_name): [sys.intern(child_name) for child_name in children]
+                      for group_name, children in cached_groups.items()}
+            logger.info("Loaded groups for %s from cache. Found %d groups.",
+                        file_path, len(groups))
+            return True, f"Группы успешно загружены/обновлены из файла. Найдено групп: {len(groups)}.", groups
 
         try:
-            df = pd.read_excel(file_path, engine='openpyxl')
-
-            # Validate columns
-            if config.EXCEL_GROUP_COLUMN not in df.columns or \
-               config.EXCEL_CHILD_COLUMN not in df.columns:
-                msg = (f"Ошибка: Excel файл должен содержать столбцы "
-                       f"'{config.EXCEL_GROUP_COLUMN}' и '{config.EXCEL_CHILD_COLUMN}'.")
-                logger.error(msg)
-                return False, msg
-
-            # Check for empty required columns
-            if df[config.EXCEL_GROUP_COLUMN].isnull().any() or \
-               df[config.EXCEL_CHILD_COLUMN].isnull().any():
-                 msg = "Ошибка: В файле Excel есть пустые ячейки в столбцах групп или имен."
-                 logger.error(msg)
-                 return False, msg
-
-
-            new_groups: GroupData = defaultdict(list)
-            for _, row in df.iterrows():
-                group_name = str(row[config.EXCEL_GROUP_COLUMN]).strip()
-                child_name = str(row[config.EXCEL_CHILD_COLUMN]).strip()
-                if group_name and child_name: # Ensure names are not empty after stripping
-                    new_groups[group_name].append(child_name)
-
-            # Sort children within each group alphabetically
-            for group in new_groups:
-                new_groups[group].sort()
-
-            self.groups = dict(new_groups)
+            # Read-only mode streams rows straight from the sheet XML
+            wb = load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                ws = wb.active
+                # Read-only sheets trust the stored <dimension> tag, which some writers get wrong
+                ws.reset_dimensions()
+                header = next(ws.iter_rows(max_row=1, values_only=True), ())
+
+                # Validate columns
+                if config.EXCEL_GROUP_COLUMN not in header or \
+                   config.EXCEL_CHILD_COLUMN not in header:
+                    msg = (f"Ошибка: Excel файл должен содержать столбцы "
+                           f"'{config.EXCEL_GROUP_COLUMN}' и '{config.EXCEL_CHILD_COLUMN}'.")
+                    logger.error(msg)
+                    return False, msg, None
+                group_col = header.index(config.EXCEL_GROUP_COLUMN)
+                child_col = header.index(config.EXCEL_CHILD_COLUMN)
+                # Only materialize the span of columns we actually use
+                first_col = min(group_col, child_col)
+                last_col = max(group_col, child_col)
+                group_col -= first_col
+                child_col -= first_col
+
+                pairs: List[Tuple[str, str]] = []
+                # Local aliases keep attribute lookups out of the per-row loop
+                _strip = str.strip
+                _intern = sys.intern
+                _append = pairs.append
+                # Rows are padded to max_col, so both indices are always valid
+                for row in ws.iter_rows(min_row=2, min_col=first_col + 1, max_col=last_col + 1,
+                                        values_only=True):
+                    group_value = row[group_col]
+                    child_value = row[child_col]
+                    if group_value is None and child_value is None:
+                        continue # Skip fully blank rows (e.g. trailing formatted rows)
+
+                    # Cells are usually already str; only convert numbers and the like
+                    if group_value is None:
+                        group_name = ""
+                    else:
+                        group_name = _strip(group_value) if type(group_value) is str else str(group_value).strip()
+                    if child_value is None:
+                        child_name = ""
+                    else:
+                        child_name = _strip(child_value) if type(child_value) is str else str(child_value).strip()
+                    # Fail fast on the first empty required cell
+                    if not group_name or not child_name:
+                        msg = "Ошибка: В файле Excel есть пустые ячейки в столбцах групп или имен."
+                        logger.error(msg)
+                        return False, msg, None
+                    # Interned names are shared with the attendance sets (see load_attendance)
+                    _append((_intern(group_name), _intern(child_name)))
+            finally:
+                wb.close()
+
+            # One sort orders groups and, within each group, children alphabetically
+            pairs.sort()
+            groups = {
+                group_name: [child_name for _, child_name in group_pairs]
+                for group_name, group_pairs in groupby(pairs, key=itemgetter(0))
+            }
+            self._save_groups_cache(file_path, file_stat, groups)
             logger.info("Successfully loaded groups from %s. Found %d groups.",
-                        file_path, len(self.groups))
-            return True, f"Группы успешно загружены/обновлены из файла. Найдено групп: {len(self.groups)}."
+                        file_path, len(groups))
+            return True, f"Группы успешно загружены/обновлены из файла. Найдено групп: {len(groups)}.", groups
 
         except FileNotFoundError:
             logger.warning("Groups Excel file not found at %s during load attempt.", file_path)
-            self.groups = {}
-            return True, "Файл с группами еще не загружен."
-        except ImportError:
-            msg = "Ошибка: Необходима библиотека 'openpyxl'. Установите ее: pip install openpyxl"
-            logger.exception(msg)
-            return False, msg
+            return True, "Файл с группами еще не загружен.", {}
         except Exception as e:
             logger.exception("Failed to load groups from Excel file %s.", file_path)
-            return False, f"Не удалось прочитать Excel файл. Ошибка: {e}"
+            return False, f"Не удалось прочитать Excel файл. Ошибка: {e}", None
+
+    def set_groups(self, groups: GroupData) -> None:
+        """Replaces the group data and rebuilds the lookups derived from it."""
+        self.groups = groups
+        self._sorted_groups = tuple(sorted(groups))
+        # Constant-time membership checks for children, whatever the group size
+        self._groups_set = {group_name: frozenset(children) for group_name, children in groups.items()}
+        # Reports list every child of the roster, so cached ones are stale now
+        self._report_cache.clear()
+
+    @staticmethod
+    def _groups_cache_path(file_path: str) -> str:
+        """Returns the path of the pickle sidecar caching the parsed groups."""
+        return f"{file_path}{GROUPS_CACHE_SUFFIX}"
+
+    def _load_groups_cache(self, file_path: str, file_stat: os.stat_result) -> Optional[GroupData]:
+        """
+        Returns the cached groups for the Excel file if the sidecar matches
+        its current mtime and size, otherwise None.
+        """
+        try:
+            with open(self._groups_cache_path(file_path), 'rb') as f:
+                cached = pickle.load(f)
+            if cached['mtime'] == file_stat.st_mtime_ns and cached['size'] == file_stat.st_size:
+                return cached['groups']
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.warning("Ignoring unreadable groups cache for %s.", file_path)
+        return None
+
+    def _save_groups_cache(self, file_path: str, file_stat: os.stat_result, groups: GroupData) -> None:
+        """Writes the parsed groups to the pickle sidecar next to the Excel file."""
+        cache = {'mtime': file_stat.st_mtime_ns, 'size': file_stat.st_size, 'groups': groups}
+        try:
+            with open(self._groups_cache_path(file_path), 'wb') as f:
+                pickle.dump(cache, f, protocol=5)
+        except OSError:
+            logger.warning("Could not write groups cache for %s.", file_path)
+
+    @property
+    def attendance(self) -> AttendanceData:
+        """
+        The attendance records, loaded from disk on first access so that
+        starting the bot does not pay for parsing the whole history.
+        """
+        if self._attendance is None:
+            self.load_attendance()
+        return self._attendance
 
     def load_attendance(self) -> None:
         """Loads attendance data from the JSON file."""
         try:
-            with open(config.ATTENDANCE_JSON_FILE, 'r', encoding='utf-8') as f:
+            with open(config.ATTENDANCE_JSON_FILE, 'rb') as f:
                 # Load and convert lists back to sets
-                loaded_data = json.load(f)
-                self.attendance = defaultdict(lambda: defaultdict(set))
+                loaded_data = orjson.loads(f.read())
+                self._attendance = {}
                 for date_str, groups_attendance in loaded_data.items():
+                    day_attendance = self.attendance.setdefault(date_str, {})
                     for group_name, children_list in groups_attendance.items():
-                        self.attendance[date_str][group_name] = set(children_list)
+                        # Interning makes every mark reference the roster's string object
+                        # instead of holding its own copy of the child's name
+                        day_attendance[sys.intern(group_name)] = set(map(sys.intern, children_list))
             logger.info("Attendance data loaded successfully from %s", config.ATTENDANCE_JSON_FILE)
         except FileNotFoundError:
             logger.warning("Attendance JSON file not found (%s). Starting with empty attendance.",
                            config.ATTENDANCE_JSON_FILE)
-            self.attendance = defaultdict(lambda: defaultdict(set))
-        except json.JSONDecodeError:
+            self._attendance = {}
+        except orjson.JSONDecodeError:
             logger.exception("Error decoding attendance JSON file %s. Data might be corrupted.",
                              config.ATTENDANCE_JSON_FILE)
             # Decide on recovery strategy: backup, start fresh, etc.
             # For now, start fresh to avoid crashing.
-            self.attendance = defaultdict(lambda: defaultdict(set))
+            self._attendance = {}
         except Exception as e:
             logger.exception("An unexpected error occurred while loading attendance data.")
-            self.attendance = defaultdict(lambda: defaultdict(set)) # Start fresh on other errors
+            self._attendance = {} # Start fresh on other errors
+
+        self._attendance_rev += 1
+
+        # Apply changes made after the last snapshot, then fold them into a new one
+        if self._replay_wal():
+            self.save_attendance()
+
+    def _replay_wal(self) -> int:
+        """
+        Applies the marks logged to the write-ahead log on top of the loaded snapshot.
+        Replaying is idempotent, so entries already contained in the snapshot are harmless.
+
+        Returns:
+            The number of entries applied.
+        """
+        applied = 0
+        try:
+            with open(config.ATTENDANCE_WAL_FILE, 'rb') as f:
+                for line in f:
+                    try:
+                        op, date_str, group_name, child_name = orjson.loads(line)
+                    except (orjson.JSONDecodeError, ValueError):
+                        # Most likely a line cut short by a crash mid-write
+                        logger.warning("Skipping malformed attendance log entry: %r", line)
+                        continue
+                    self._apply_change(op, date_str, sys.intern(group_name), sys.intern(child_name))
+                    applied += 1
+        except FileNotFoundError:
+            return 0
+        logger.info("Replayed %d attendance log entries from %s", applied, config.ATTENDANCE_WAL_FILE)
+        return applied
+
+    def _apply_change(self, op: str, date_str: str, group_name: str, child_name: str) -> bool:
+        """
+        Applies a single mark ('+') or unmark ('-') to the in-memory attendance.
+
+        Returns:
+            True if the attendance actually changed.
+        """
+        if op == WAL_MARK:
+            present = self.attendance.setdefault(date_str, {}).setdefault(group_name, set())
+            if child_name in present:
+                return False
+            present.add(child_name)
+        else:
+            present = self.attendance.get(date_str, {}).get(group_name)
+            if not present or child_name not in present:
+                return False
+            present.discard(child_name)
+        self._attendance_rev += 1
+        return True
+
+    def _log_change(self, op: str, date_str: str, group_name: str, child_name: str) -> None:
+        """Appends a change to the write-ahead log, compacting it once it grows too long."""
+        try:
+            if self._wal is None:
+                self._wal = open(config.ATTENDANCE_WAL_FILE, 'ab', buffering=0)
+            self._wal.write(orjson.dumps([op, date_str, group_name, child_name]) + b'\n')
+            self._wal_lines += 1
+        except OSError:
+            logger.exception("Error appending to attendance log %s", config.ATTENDANCE_WAL_FILE)
+            # Reopen the log on the next change rather than reuse a broken handle
+            if self._wal is not None:
+                try:
+                    self._wal.close()
+                except OSError:
+                    pass
+                self._wal = None
+            # The change exists only in memory, so write a full snapshot instead;
+            # if that fails too, the background flush keeps retrying it
+            if not self.save_attendance():
+                self._schedule_flush()
+            return
+        if self._wal_lines >= config.ATTENDANCE_WAL_COMPACT_LINES:
+            self.save_attendance()
+        else:
+            self._schedule_flush()
+
+    def _truncate_wal(self) -> None:
+        """Empties the write-ahead log once its changes are part of a saved snapshot."""
+        try:
+            if self._wal is not None:
+                self._wal.truncate(0)
+            elif os.path.exists(config.ATTENDANCE_WAL_FILE):
+                open(config.ATTENDANCE_WAL_FILE, 'wb').close()
+        except OSError:
+            logger.exception("Error truncating attendance log %s", config.ATTENDANCE_WAL_FILE)
+            return
+        self._wal_lines = 0
 
     def save_attendance(self) -> bool:
         """Saves the current attendance data to the JSON file."""
         try:
-            # Convert sets to lists for JSON serialization
-            serializable_attendance = defaultdict(lambda: defaultdict(list))
-            for date_str, groups_attendance in self.attendance.items():
-                for group_name, children_set in groups_attendance.items():
-                    serializable_attendance[date_str][group_name] = sorted(list(children_set)) # Sort for consistency
-
-            with open(config.ATTENDANCE_JSON_FILE, 'w', encoding='utf-8') as f:
-                json.dump(serializable_attendance, f, ensure_ascii=False, indent=4)
-            logger.info("Attendance data saved successfully to %s", config.ATTENDANCE_JSON_FILE)
-            return True
-        except IOError as e:
-            logger.exception("Error writing attendance data to %s", config.ATTENDANCE_JSON_FILE)
-            return False
+            payload = self._serialize_attendance()
         except Exception as e:
             logger.exception("An unexpected error occurred while saving attendance data.")
             return False
+        self._dirty = False # A pending background flush has nothing left to write
+        self._last_save_ok = self._write_snapshot(payload, self._attendance_rev)
+        if not self._last_save_ok:
+            return False
+        self._truncate_wal()
+        return True
+
+    def _serialize_attendance(self) -> bytes:
+        """Encodes the current attendance data as JSON."""
+        # orjson cannot encode sets, so convert them to sorted lists (sorted for consistency)
+        serializable_attendance = {
+            date_str: {group_name: sorted(children_set)
+                       for group_name, children_set in groups_attendance.items()}
+            for date_str, groups_attendance in self.attendance.items()
+        }
+        return orjson.dumps(serializable_attendance, option=orjson.OPT_SORT_KEYS)
 
-    def get_groups(self) -> List[str]:
-        """Returns a sorted list of group names."""
-        return sorted(self.groups.keys())
+    def _write_snapshot(self, payload: bytes, rev: int) -> bool:
+        """
+        Writes an encoded snapshot to the JSON file. Safe to call from a worker thread:
+        a snapshot older than the one already on disk is skipped rather than written.
+        """
+        tmp_path = f"{config.ATTENDANCE_JSON_FILE}.tmp"
+        with self._snapshot_lock:
+            if rev < self._snapshot_rev:
+                return True
+            try:
+                # Writing to a temp file and replacing keeps the old file intact on failure.
+                with open(tmp_path, 'wb') as f:
+                    f.write(payload)
+                os.replace(tmp_path, config.ATTENDANCE_JSON_FILE)
+            except IOError as e:
+                logger.exception("Error writing attendance data to %s", config.ATTENDANCE_JSON_FILE)
+                return False
+            except Exception as e:
+                logger.exception("An unexpected error occurred while saving attendance data.")
+                return False
+            self._snapshot_rev = rev
+        logger.info("Attendance data saved successfully to %s", config.ATTENDANCE_JSON_FILE)
+        return True
+
+    def _schedule_flush(self) -> None:
+        """
+        Marks the attendance as changed and, when called from a running event loop,
+        schedules a snapshot at most once per config.ATTENDANCE_FLUSH_DELAY seconds.
+        Without a loop the write-ahead log alone keeps changes durable.
+        """
+        self._dirty = True
+        if self._flush_handle is not None or self._flush_future is not None:
+            return # Already scheduled or in flight; _flush_done picks up the new changes
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._flush_handle = loop.call_later(config.ATTENDANCE_FLUSH_DELAY, self._flush)
+
+    def _flush(self) -> None:
+        """Encodes a snapshot on the event loop and writes it from the default executor."""
+        self._flush_handle = None
+        if not self._dirty:
+            return
+        self._dirty = False
+        # Encoding stays on the loop thread, so the executor never iterates live sets
+        rev = self._attendance_rev
+        try:
+            payload = self._serialize_attendance()
+        except Exception:
+            logger.exception("An unexpected error occurred while saving attendance data.")
+            return
+        future = asyncio.get_running_loop().run_in_executor(None, self._write_snapshot, payload, rev)
+        self._flush_future = future
+        future.add_done_callback(functools.partial(self._flush_done, rev))
+
+    def _flush_done(self, rev: int, future: asyncio.Future) -> None:
+        """Truncates the log after a background snapshot, or retries a failed one."""
+        self._flush_future = None
+        self._last_save_ok = future.result()
+        if not self._last_save_ok:
+            self._dirty = True
+        elif rev == self._attendance_rev:
+            # Nothing changed while writing, so the snapshot covers every logged change
+            self._truncate_wal()
+        if self._dirty:
+            self._schedule_flush()
+
+    def schedule_save(self) -> bool:
+        """
+        Requests a snapshot of the attendance data from the background flush instead of
+        writing it inline. Marks are already in the write-ahead log, so nothing is lost
+        while the snapshot is pending.
+
+        Returns:
+            False if the most recent snapshot write failed, True otherwise.
+        """
+        if self._dirty:
+            self._schedule_flush()
+        return self._last_save_ok
+
+    def get_groups(self) -> Tuple[str, ...]:
+        """Returns the group names, sorted. The tuple is rebuilt only when groups are reloaded."""
+        return self._sorted_groups
 
     def get_children_for_group(self, group_name: str) -> List[str]:
-        """Returns a list of children for a specific group."""
+        """Returns the list of children for a specific group, already sorted at load time."""
         return self.groups.get(group_name, [])
 
     def get_attendance_for_day_group(self, date_str: str, group_name: str) -> Set[str]:
@@ -168,25 +483,19 @@ class DataManager:
 
     def mark_attendance(self, date_str: str, group_name: str, child_name: str) -> None:
         """Marks a child as present for a specific group on a specific date."""
-        if group_name not in self.groups or child_name not in self.groups[group_name]:
+        if group_name not in self._groups_set or child_name not in self._groups_set[group_name]:
              logger.warning("Attempted to mark attendance for unknown group/child: %s / %s",
                             group_name, child_name)
              return # Or raise an error? Silently failing for now.
 
-        # Ensure the date entry exists
-        if date_str not in self.attendance:
-            self.attendance[date_str] = defaultdict(set)
-        # Ensure the group entry exists for the date
-        if group_name not in self.attendance[date_str]:
-             self.attendance[date_str][group_name] = set()
-
-        self.attendance[date_str][group_name].add(child_name)
+        if self._apply_change(WAL_MARK, date_str, group_name, child_name):
+            self._log_change(WAL_MARK, date_str, group_name, child_name)
         logger.debug("Marked %s as present in %s on %s", child_name, group_name, date_str)
 
     def unmark_attendance(self, date_str: str, group_name: str, child_name: str) -> None:
         """Marks a child as absent (removes from the present set)."""
-        if date_str in self.attendance and group_name in self.attendance[date_str]:
-            self.attendance[date_str][group_name].discard(child_name)
+        if self._apply_change(WAL_UNMARK, date_str, group_name, child_name):
+            self._log_change(WAL_UNMARK, date_str, group_name, child_name)
             logger.debug("Marked %s as absent in %s on %s", child_name, group_name, date_str)
             # Optional: Clean up empty sets/dates if desired, but might complicate logic
             # if not self.attendance[date_str][group_name]:
@@ -194,6 +503,20 @@ class DataManager:
             # if not self.attendance[date_str]:
             #     del self.attendance[date_str]
 
+    def toggle_attendance(self, date_str: str, group_name: str, child_name: str) -> bool:
+        """
+        Flips a child's attendance for a specific group on a specific date.
+
+        Returns:
+            True if the child is marked as present afterwards, False otherwise.
+        """
+        present = self.attendance.get(date_str, {}).get(group_name)
+        if present and child_name in present:
+            self.unmark_attendance(date_str, group_name, child_name)
+        else:
+            self.mark_attendance(date_str, group_name, child_name)
+        present = self.attendance.get(date_str, {}).get(group_name)
+        return bool(present) and child_name in present
 
     def purge_stale_entries(self) -> Tuple[int, int]:
         """Remove groups and children absent from the current Excel file.
@@ -220,7 +543,7 @@ class DataManager:
         for date_str in list(self.attendance.keys()):
             groups_data = self.attendance[date_str]
             for group_name, children_set in list(groups_data.items()):
-                allowed_children = set(self.groups.get(group_name, []))
+                allowed_children = self._groups_set.get(group_name, frozenset())
                 before = len(children_set)
                 children_set.intersection_update(allowed_children)
                 removed_children += before - len(children_set)
@@ -230,6 +553,7 @@ class DataManager:
                 del self.attendance[date_str]
 
         if removed_groups or removed_children:
+            self._attendance_rev += 1
             self.save_attendance()
 
         return len(removed_groups), removed_children
@@ -255,16 +579,25 @@ class DataManager:
              logger.warning("Cannot generate report: Number of days must be positive.")
              return None
 
+        attendance = self.attendance # Triggers the lazy load before the revision is read
         end_date = date.today()
+        # Reuse the report file while neither the window nor the data has changed.
+        # One entry per window length: a newer report overwrites the same file anyway.
+        cache_state = (end_date.isoformat(), self._attendance_rev)
+        cached = self._report_cache.get(days)
+        if cached and cached[:2] == cache_state and os.path.exists(cached[2]):
+            logger.info("Reusing cached attendance report: %s", cached[2])
+            return cached[2]
+
         start_date = end_date - timedelta(days=days - 1)
-        date_range = [start_date + timedelta(days=i) for i in range(days)]
-        date_str_range = [d.isoformat() for d in date_range]
+        # 'YYYY-MM-DD' strings sort chronologically, so a range check replaces a per-day lookup
+        start_str, end_str = start_date.isoformat(), end_date.isoformat()
 
         # Filter attendance data to include only the relevant date range and *recorded* days
         relevant_attendance: AttendanceData = {
             date_str: groups_data
-            for date_str, groups_data in self.attendance.items()
-            if date_str in date_str_range and any(groups_data.values()) # Only include days where *someone* was marked
+            for date_str, groups_data in attendance.items()
+            if start_str <= date_str <= end_str and any(groups_data.values()) # Only include days where *someone* was marked
         }
 
         if not relevant_attendance:
@@ -274,7 +607,6 @@ class DataManager:
         # Get all unique dates where attendance was actually recorded within the range
         recorded_dates_sorted = sorted(relevant_attendance.keys())
 
-        report_data = []
         # Collect all groups and children from both the current roster
         # and the attendance history within the requested range. This
         # ensures that children or entire groups removed from the latest
@@ -292,58 +624,67 @@ class DataManager:
             for group_name, children_set in groups_data.items():
                 groups_children[group_name].update(children_set)
 
-        for group_name, children_set in groups_children.items():
-            for child_name in sorted(children_set):
-                child_row = {"Группа": group_name, "Имя Ребенка": child_name}
-                for report_date_str in recorded_dates_sorted:
-                    present_today = child_name in relevant_attendance.get(report_date_str, {}).get(group_name, set())
-                    child_row[report_date_str] = 1 if present_today else 0  # Use 1 for present, 0 for absent
-                report_data.append(child_row)
-
-        if not report_data:
+        all_children: List[Tuple[str, str]] = [
+            (group_name, child_name)
+            for group_name, children_set in groups_children.items()
+            for child_name in sorted(children_set)
+        ]
+
+        if not all_children:
              logger.info("No children found in groups to generate report.")
              return None # Should not happen if self.groups is populated, but safety check
 
+        # Presence matrix: one row per child, one column per recorded date (1 = present, 0 = absent)
+        child_idx = {child: idx for idx, child in enumerate(all_children)}
+        matrix = np.zeros((len(all_children), len(recorded_dates_sorted)), dtype=np.uint8)
+        for day_col, report_date_str in enumerate(recorded_dates_sorted):
+            for group_name, present_set in relevant_attendance[report_date_str].items():
+                idxs = np.fromiter((child_idx[(group_name, child_name)] for child_name in present_set),
+                                   dtype=np.int32, count=len(present_set))
+                matrix[idxs, day_col] = 1
 
         try:
-            df = pd.DataFrame(report_data)
-            # Set MultiIndex
-            df = df.set_index(["Группа", "Имя Ребенка"])
-            # Ensure date columns are sorted correctly
-            df = df[recorded_dates_sorted]
-
-            # Calculate monthly and total attendance for each child
-            date_objects = [pd.to_datetime(d) for d in recorded_dates_sorted]
-            month_to_dates: Dict[str, List[str]] = defaultdict(list)
-            for obj, date_str in zip(date_objects, recorded_dates_sorted):
-                month_label = obj.strftime("%Y-%m")
-                month_to_dates[month_label].append(date_str)
-
-            monthly_columns: List[str] = []
-            for month_label in sorted(month_to_dates.keys()):
-                df[month_label] = df[month_to_dates[month_label]].sum(axis=1)
-                monthly_columns.append(month_label)
-
-            df["Итого"] = df[recorded_dates_sorted].sum(axis=1)
-            df = df[recorded_dates_sorted + monthly_columns + ["Итого"]]
+            # Calculate monthly and total attendance for each child.
+            # Dates are sorted, so each month is a contiguous block of matrix columns.
+            month_to_cols: Dict[str, List[int]] = defaultdict(list)
+            for day_col, report_date_str in enumerate(recorded_dates_sorted):
+                month_to_cols[report_date_str[:7]].append(day_col) # 'YYYY-MM'
+            monthly_columns = sorted(month_to_cols.keys())
+            totals = np.column_stack(
+                [matrix[:, month_to_cols[month_label]].sum(axis=1, dtype=np.int64)
+                 for month_label in monthly_columns]
+                + [matrix.sum(axis=1, dtype=np.int64)]
+            )
 
             report_filename = f"attendance_report_{end_date.strftime('%Y%m%d')}_last_{days}d.xlsx"
             report_filepath = os.path.join(config.REPORTS_DIR, report_filename)
+            # Build the report next to the final path and swap it in, so a send that is
+            # still reading the previous version never sees a half-written file
+            tmp_filepath = f"{report_filepath}.tmp"
 
-            daily_df = df[recorded_dates_sorted]
-            totals_df = df[monthly_columns + ["Итого"]]
-
-            with pd.ExcelWriter(report_filepath, engine='openpyxl') as writer:
-                daily_df.to_excel(writer, sheet_name="Посещаемость")
-                totals_df.to_excel(writer, sheet_name="Итоги")
+            # constant_memory flushes every row to disk as soon as the next one starts,
+            # so rows must be written strictly top to bottom.
+            workbook = xlsxwriter.Workbook(tmp_filepath, {'constant_memory': True})
+            try:
+                header_format = workbook.add_format({'bold': True})
+                sheets = (
+                    ("Посещаемость", recorded_dates_sorted, matrix),
+                    ("Итоги", monthly_columns + ["Итого"], totals),
+                )
+                for sheet_name, columns, values in sheets:
+                    worksheet = workbook.add_worksheet(sheet_name)
+                    worksheet.write_row(0, 0, ["Группа", "Имя Ребенка"] + columns, header_format)
+                    for row_idx, ((group_name, child_name), row_values) in enumerate(
+                            zip(all_children, values.tolist()), start=1):
+                        worksheet.write_row(row_idx, 0, [group_name, child_name] + row_values)
+            finally:
+                workbook.close()
+            os.replace(tmp_filepath, report_filepath)
 
             logger.info("Attendance report generated successfully: %s", report_filepath)
+            self._report_cache[days] = (*cache_state, report_filepath)
             return report_filepath
 
-        except ImportError:
-            logger.exception("Error generating report: 'openpyxl' required.")
-            # Maybe notify the user via Telegram as well?
-            return None
         except Exception as e:
             logger.exception("Error generating attendance report.")
             return None
@@ -2,20 +2,26 @@
 Telegram bot command and callback query handlers.
 """
 
+import asyncio
+import functools
 import logging
 import os
-from typing import cast, Dict
+from typing import cast, Awaitable, Callable, Dict, List, Tuple
 
-from telegram import Update, InputFile
+import aiofiles
+from telegram import CallbackQuery, InlineKeyboardMarkup, Update, InputFile
 from telegram.ext import (
     ContextTypes,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     ConversationHandler,
+    TypeHandler,
+    ApplicationHandlerStop,
     filters,
 )
 from telegram.constants import ParseMode
+from telegram.error import TelegramError
 from telegram.helpers import escape_markdown
 
 import config
@@ -29,27 +35,54 @@ logger = logging.getLogger(__name__)
 ASKING_FOR_DAYS = 1
 
 # --- Initialization ---
-# Create a single instance of DataManager to be used across handlers
-data_manager = DataManager()
-
-# --- Helper Function ---
-async def check_authorization(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    """Checks if the user is authorized. Sends a message if not."""
-    if not utils.check_user_authorization(update.effective_user.id):
-        logger.warning("Unauthorized access attempt by user ID: %s", update.effective_user.id)
-        if update.effective_message:
-            await update.effective_message.reply_text(config.UNAUTHORIZED_MESSAGE)
-        return False
-    return True
+@functools.lru_cache(maxsize=1)
+def get_dm() -> DataManager:
+    """Returns the single DataManager shared by all handlers, creating it on first use.
+
+    Creating it lazily keeps disk I/O out of module import; main() warms it up
+    in a worker thread before polling starts.
+    """
+    return DataManager()
+
+# --- Authorization Gate ---
+# Unauthorized updates that still get an explanation; everything else
+# (group chatter, edits, channel posts) is dropped silently
+_UNAUTHORIZED_REPLY_FILTER = filters.UpdateType.MESSAGE & filters.COMMAND & filters.ChatType.PRIVATE
+
+
+async def _auth_gate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Runs before every other handler and stops updates from unauthorized users."""
+    user = update.effective_user
+    # Cached, synchronous check: authorized updates fall through to the regular handlers
+    if user is not None and utils.check_user_authorization(user.id):
+        return
+    try:
+        if update.callback_query:
+            logger.warning("Unauthorized access attempt by user ID: %s", user.id if user else None)
+            # Answer callback query to remove the "loading" state on the button
+            await update.callback_query.answer(text=config.UNAUTHORIZED_MESSAGE, show_alert=True)
+        elif _UNAUTHORIZED_REPLY_FILTER.check_update(update):
+            logger.warning("Unauthorized access attempt by user ID: %s", user.id if user else None)
+            await update.message.reply_text(config.UNAUTHORIZED_MESSAGE)
+    except TelegramError as e:
+        # E.g. the user blocked the bot; the update must still be stopped below,
+        # since any exception other than ApplicationHandlerStop lets it through
+        logger.warning("Could not notify unauthorized user %s: %s", user.id if user else None, e)
+    except Exception:
+        logger.exception("Error notifying unauthorized user %s", user.id if user else None)
+    raise ApplicationHandlerStop
 
 # --- Command Handlers ---
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handles the /start command."""
-    if not await check_authorization(update, context):
-        return
-
-    user_name = escape_markdown(update.effective_user.first_name)
+    # The escaped name is reused until the user changes their first name
+    first_name = update.effective_user.first_name
+    user_name = context.user_data.get("esc_name")
+    if user_name is None or context.user_data.get("raw_name") != first_name:
+        user_name = escape_markdown(first_name)
+        context.user_data["esc_name"] = user_name
+        context.user_data["raw_name"] = first_name
     welcome_message = (
         f"👋 Привет, {user_name}!\n\n"
         "Я помогу тебе вести учет посещаемости детей.\n\n"
@@ -65,8 +98,6 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 async def upload_excel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handles the /upload command, prompting for the file."""
-    if not await check_authorization(update, context):
-        return
     if update.effective_message:
         await update.effective_message.reply_text(
             "Пожалуйста, отправь мне файл `.xlsx` с данными.\n"
@@ -76,7 +107,7 @@ async def upload_excel_command(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def handle_excel_upload(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handles the actual Excel file upload."""
-    if not await check_authorization(update, context) or not update.message or not update.message.document:
+    if not update.message or not update.message.document:
         return
 
     document = update.message.document
@@ -89,11 +120,18 @@ async def handle_excel_upload(update: Update, context: ContextTypes.DEFAULT_TYPE
         # Ensure data directory exists before downloading
         utils.ensure_dir_exists(config.DATA_DIR)
         file_path = config.GROUPS_EXCEL_FILE
-        await file.download_to_drive(file_path)
+        data = await file.download_as_bytearray()
+        async with aiofiles.open(file_path, 'wb', buffering=1024 * 1024) as f:
+            await f.write(data)
         logger.info("Excel file downloaded to %s", file_path)
 
-        # Reload data using DataManager
-        success, message = data_manager.load_groups_from_excel(file_path)
+        # Parse the workbook in a worker thread so it doesn't block the event loop, but
+        # swap the groups in here, where handlers never see a half-updated roster
+        success, message, groups = await asyncio.to_thread(get_dm().read_groups_from_excel, file_path)
+        if groups is not None:
+            get_dm().set_groups(groups)
+            # Keyboards built for the previous roster will not be requested again
+            keyboards.clear_keyboard_cache()
         await update.message.reply_text(message)
 
     except Exception as e:
@@ -103,10 +141,7 @@ async def handle_excel_upload(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def mark_attendance_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handles the /mark command to start attendance marking."""
-    if not await check_authorization(update, context):
-        return
-
-    groups = data_manager.get_groups()
+    groups = get_dm().get_groups()
     if not groups:
         if update.effective_message:
             await update.effective_message.reply_text(
@@ -121,17 +156,14 @@ async def mark_attendance_command(update: Update, context: ContextTypes.DEFAULT_
 
 async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handles the /report command, starts the conversation for getting N days."""
-    if not await check_authorization(update, context):
-        return ConversationHandler.END # End conversation if unauthorized
-
-    if not data_manager.groups:
+    if not get_dm().groups:
          if update.effective_message:
             await update.effective_message.reply_text(
                 "Нет данных о группах для создания отчета. Загрузите Excel файл."
             )
          return ConversationHandler.END
 
-    if not data_manager.attendance:
+    if not get_dm().attendance:
         if update.effective_message:
             await update.effective_message.reply_text(
                 "Нет данных о посещаемости для создания отчета."
@@ -148,7 +180,7 @@ async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def receive_report_days(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Receives the number of days for the report and generates it."""
-    if not await check_authorization(update, context) or not update.message or not update.message.text:
+    if not update.message or not update.message.text:
         return ConversationHandler.END # Should not happen in conversation, but safety check
 
     try:
@@ -164,18 +196,19 @@ async def receive_report_days(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     await update.message.reply_text("Генерирую отчет...")
 
-    report_path = data_manager.generate_attendance_report(days)
+    report_path = get_dm().generate_attendance_report(days)
 
     if report_path and os.path.exists(report_path):
         try:
-            with open(report_path, 'rb') as report_file:
-                 # Use InputFile to send the document correctly
-                input_file = InputFile(report_file, filename=os.path.basename(report_path))
-                await context.bot.send_document(
-                    chat_id=update.effective_chat.id,
-                    document=input_file,
-                    caption=f"Отчет о посещаемости за последние {days} дней."
-                )
+            # Read the report in a worker thread so disk latency doesn't block the event loop
+            report_bytes = await asyncio.to_thread(utils.read_file_bytes, report_path)
+            # Use InputFile to send the document correctly
+            input_file = InputFile(report_bytes, filename=os.path.basename(report_path))
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=input_file,
+                caption=f"Отчет о посещаемости за последние {days} дней."
+            )
             # Optionally remove the file after sending, or keep it in reports dir
             # os.remove(report_path)
         except FileNotFoundError:
@@ -185,7 +218,7 @@ async def receive_report_days(update: Update, context: ContextTypes.DEFAULT_TYPE
              logger.exception("Failed to send the report file.")
              await update.message.reply_text(f"Не удалось отправить файл отчета. Ошибка: {e}")
 
-    elif report_path is None and data_manager.groups: # Check if report gen failed vs no data
+    elif report_path is None and get_dm().groups: # Check if report gen failed vs no data
         await update.message.reply_text("Не удалось сгенерировать отчет. Проверь логи.")
     else: # No relevant attendance data was found
          await update.message.reply_text(f"Нет данных о посещаемости за последние {days} дней для генерации отчета.")
@@ -196,9 +229,6 @@ async def receive_report_days(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancels the current operation (like report generation)."""
-    if not await check_authorization(update, context):
-        return ConversationHandler.END
-
     if update.effective_message:
         await update.effective_message.reply_text("Операция отменена.")
     return ConversationHandler.END
@@ -206,10 +236,7 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def purge_stale_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Deletes attendance data for groups/children missing from the current Excel."""
-    if not await check_authorization(update, context):
-        return
-
-    removed_groups, removed_children = data_manager.purge_stale_entries()
+    removed_groups, removed_children = get_dm().purge_stale_entries()
     if update.effective_message:
         if removed_groups or removed_children:
             await update.effective_message.reply_text(
@@ -222,12 +249,6 @@ async def purge_stale_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handles all inline button presses."""
-    if not await check_authorization(update, context):
-        # Answer callback query to remove the "loading" state on the button
-        if update.callback_query:
-            await update.callback_query.answer(text=config.UNAUTHORIZED_MESSAGE, show_alert=True)
-        return
-
     query = update.callback_query
     if not query or not query.data:
         return
@@ -236,35 +257,26 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
 
     # --- Callback Data Routing ---
     current_date_str = utils.get_current_date_str()
-    parts = query.data.split(":")
-    prefix = parts[0]
+    try:
+        op, group_index, child_index = keyboards.unpack_callback_data(query.data)
+        handler, takes_child = CALLBACK_ROUTES[op]
+    except (ValueError, IndexError):
+        # Unknown operation or a keyboard sent by an older version of the bot
+        logger.warning("Unhandled callback data: %s", query.data)
+        if query.message:
+            await query.edit_message_text(text=f"Неизвестное действие: {query.data}")
+        return
 
     try:
-        if prefix == "group_select":
-            group_index = int(parts[1])
-            await handle_group_selection(update, context, group_index, current_date_str)
-
-        elif prefix == "attendance_toggle":
-            # Unpack group and child indices safely
-            if len(parts) < 3:
-                logger.error("Invalid callback data for toggle: %s", query.data)
-                return
-            group_index = int(parts[1])
-            child_index = int(parts[2])
-            await handle_toggle_attendance(update, context, group_index, child_index,
-                                           current_date_str)
-
-        elif prefix == "attendance_save":
-            group_index = int(parts[1])
-            await handle_save_attendance(update, context, group_index, current_date_str)
-
+        if takes_child:
+            await handler(update, context, group_index, child_index, current_date_str)
         else:
-            logger.warning("Unhandled callback prefix: %s", prefix)
-            if query.message:
-                await query.edit_message_text(text=f"Неизвестное действие: {query.data}")
+            await handler(update, context, group_index, current_date_str)
 
     except Exception as e:
-        logger.exception("Error processing callback query: %s", query.data)
+        # The full traceback is only worth formatting when debugging
+        logger.error("Error processing callback %s: %r", query.data, e,
+                     exc_info=logger.isEnabledFor(logging.DEBUG))
         if query.message:
             await query.edit_message_text(text=f"Произошла ошибка при обработке запроса: {e}")
 
@@ -274,26 +286,31 @@ async def handle_group_selection(
 ) -> None:
     """Handles selection of a group to mark attendance."""
     query = update.callback_query
-    groups = data_manager.get_groups()
+    groups = get_dm().get_groups()
     if group_index >= len(groups):
         logger.error("Invalid group index %s", group_index)
         return
     group_name = groups[group_index]
 
-    children = data_manager.get_children_for_group(group_name)
+    children = get_dm().get_children_for_group(group_name)
     if not children:
         if query and query.message:
             await query.edit_message_text(text=f"В группе '{group_name}' нет детей согласно последнему файлу Excel.")
         return
 
-    present_children = data_manager.get_attendance_for_day_group(date_str, group_name)
+    present_children = get_dm().get_attendance_for_day_group(date_str, group_name)
     keyboard = keyboards.generate_attendance_keyboard(group_index, group_name, children, present_children)
+    _stash_attendance_keyboard(context, group_index, date_str, children, keyboard)
 
     if query and query.message:
+        message_id = query.message.message_id
+        _forget_message_keyboard(context, message_id)
         await query.edit_message_text(
             text=f"Отметь присутствующих в группе '{group_name}' на {date_str}:",
             reply_markup=keyboard
         )
+        # Only the keyboard just shown is tracked; older messages at worst get one redundant edit
+        context.user_data["kb_hashes"] = {message_id: _keyboard_hash(keyboard)}
 
 
 async def handle_toggle_attendance(
@@ -302,38 +319,116 @@ async def handle_toggle_attendance(
     """Handles toggling the attendance status of a child."""
     query = update.callback_query
 
-    groups = data_manager.get_groups()
+    groups = get_dm().get_groups()
     if group_index >= len(groups):
         logger.error("Invalid group index %s", group_index)
         return
     group_name = groups[group_index]
 
-    children = data_manager.get_children_for_group(group_name)
+    children = get_dm().get_children_for_group(group_name)
     if child_index >= len(children):
         logger.error("Invalid child index %s for group %s", child_index, group_name)
         return
     child_name = children[child_index]
 
-    present_children = data_manager.get_attendance_for_day_group(date_str, group_name)
+    stash = context.user_data.get("attendance_kb")
+    # The roster list is replaced on every upload, so identity tells whether the stash is current
+    if (not stash or stash["group_index"] != group_index or stash["date"] != date_str
+            or stash["children"] is not children):
+        # No keyboard remembered for this group, day and roster (e.g. after a restart or
+        # an upload): build it once
+        present_children = get_dm().get_attendance_for_day_group(date_str, group_name)
+        keyboard = keyboards.generate_attendance_keyboard(group_index, group_name, children, present_children)
+        stash = _stash_attendance_keyboard(context, group_index, date_str, children, keyboard)
 
-    if child_name in present_children:
-        data_manager.unmark_attendance(date_str, group_name, child_name)
-        logger.info("User unmarked %s in %s for %s", child_name, group_name, date_str)
-    else:
-        data_manager.mark_attendance(date_str, group_name, child_name)
-        logger.info("User marked %s in %s for %s", child_name, group_name, date_str)
+    # DataManager decides the new state, so the button follows it even if the
+    # child was toggled meanwhile from another chat
+    is_present = get_dm().toggle_attendance(date_str, group_name, child_name)
+    # Toggles are the busiest path; skip building the log record when INFO is off
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("User %s %s in %s for %s", "marked" if is_present else "unmarked",
+                    child_name, group_name, date_str)
 
-    # Important: Refresh the keyboard with the updated state
-    updated_present_children = data_manager.get_attendance_for_day_group(date_str, group_name)
-    keyboard = keyboards.generate_attendance_keyboard(group_index, group_name, children, updated_present_children)
+    # Important: Refresh the keyboard with the updated state.
+    # Only the toggled child's button changes, so swap just that row.
+    rows = stash["rows"]
+    rows[child_index] = (keyboards.generate_attendance_button(
+        group_index, child_index, child_name, is_present),)
+    keyboard = InlineKeyboardMarkup(rows)
 
     if query and query.message:
-        # Avoid errors if the message content hasn't actually changed
-        # (though it should have due to the checkmark)
+        # Coalesce rapid toggles: only the last keyboard within the debounce window is sent.
+        # Pending edits are tracked per message so toggles in another message are unaffected.
+        pending_edits: Dict[int, asyncio.Task] = context.user_data.setdefault("pending_edits", {})
+        message_id = query.message.message_id
+        pending = pending_edits.get(message_id)
+        if pending and not pending.done():
+            pending.cancel()
+        pending_edits[message_id] = context.application.create_task(
+            _edit_reply_markup_debounced(
+                query, keyboard, pending_edits, context.user_data.setdefault("kb_hashes", {})
+            ),
+            update=update
+        )
+
+
+def _stash_attendance_keyboard(
+    context: ContextTypes.DEFAULT_TYPE,
+    group_index: int,
+    date_str: str,
+    children: List[str],
+    keyboard: InlineKeyboardMarkup,
+) -> Dict:
+    """Remembers the shown attendance keyboard so toggles only replace a single button."""
+    stash = {
+        "group_index": group_index,
+        "date": date_str,
+        "children": children,
+        "rows": list(keyboard.inline_keyboard),
+    }
+    context.user_data["attendance_kb"] = stash
+    return stash
+
+
+def _keyboard_hash(keyboard: InlineKeyboardMarkup) -> int:
+    """Hashes the text and callback data of every button in the keyboard."""
+    return hash(tuple((button.text, button.callback_data)
+                      for row in keyboard.inline_keyboard for button in row))
+
+
+def _forget_message_keyboard(context: ContextTypes.DEFAULT_TYPE, message_id: int) -> None:
+    """Cancels a pending keyboard edit and drops the keyboard hash of a message whose keyboard is replaced."""
+    pending = context.user_data.get("pending_edits", {}).pop(message_id, None)
+    if pending and not pending.done():
+        pending.cancel()
+    context.user_data.get("kb_hashes", {}).pop(message_id, None)
+
+
+async def _edit_reply_markup_debounced(
+    query: CallbackQuery,
+    keyboard: InlineKeyboardMarkup,
+    pending_edits: Dict[int, asyncio.Task],
+    kb_hashes: Dict[int, int],
+) -> None:
+    """Edits the message keyboard after a short delay, unless a newer toggle cancels it."""
+    message_id = query.message.message_id
+    try:
+        await asyncio.sleep(config.KEYBOARD_EDIT_DEBOUNCE)
+        # Toggling a child twice within the debounce window leaves the keyboard as it is
+        # on screen; skip the request instead of letting Telegram reject it as unmodified
+        kb_hash = _keyboard_hash(keyboard)
+        if kb_hashes.get(message_id) == kb_hash:
+            return
         try:
             await query.edit_message_reply_markup(reply_markup=keyboard)
         except Exception as e:
             logger.warning("Could not edit reply markup (maybe unchanged?): %s", e)
+            return
+        kb_hashes[message_id] = kb_hash
+    finally:
+        # A newer toggle may already have registered its own task for this message
+        if pending_edits.get(message_id) is asyncio.current_task():
+            del pending_edits[message_id]
 
 
 async def handle_save_attendance(
@@ -341,14 +436,20 @@ async def handle_save_attendance(
 ) -> None:
     """Handles saving the attendance for the day."""
     query = update.callback_query
-    groups = data_manager.get_groups()
+    groups = get_dm().get_groups()
     if group_index >= len(groups):
         logger.error("Invalid group index %s", group_index)
         return
     group_name = groups[group_index]
 
-    if data_manager.save_attendance():
-        logger.info("Attendance saved successfully for %s.", date_str)
+    if query and query.message:
+        # The attendance keyboard is about to be replaced, so a pending edit must not restore it
+        _forget_message_keyboard(context, query.message.message_id)
+
+    # The snapshot is written in the background; the reply doesn't wait for the disk
+    if get_dm().schedule_save():
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Attendance save scheduled for %s.", date_str)
         if query and query.message:
             # Optionally, provide a way back to group selection or just confirm
             keyboard = keyboards.generate_group_selection_keyboard(groups) # Show groups again
@@ -366,7 +467,7 @@ async def handle_save_attendance(
 # async def handle_back_to_group_select(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 #     """Handles the 'Back' button press to return to group selection."""
 #     query = update.callback_query
-#     groups = data_manager.get_groups()
+#     groups = get_dm().get_groups()
 #     if not groups:
 #         if query and query.message:
 #              await query.edit_message_text("Нет доступных групп.")
@@ -377,10 +478,23 @@ async def handle_save_attendance(
 #         await query.edit_message_text("Выбери группу для отметки посещаемости сегодня:", reply_markup=keyboard)
 
 
+# --- Callback Routing Table ---
+
+# (handler, whether it takes the child index), indexed by keyboards.OP_* code
+CALLBACK_ROUTES: Tuple[Tuple[Callable[..., Awaitable[None]], bool], ...] = (
+    (handle_group_selection, False),    # OP_GROUP_SELECT
+    (handle_toggle_attendance, True),   # OP_ATTENDANCE_TOGGLE
+    (handle_save_attendance, False),    # OP_ATTENDANCE_SAVE
+)
+
+
 # --- Setup Handlers ---
 
 def register_handlers(application) -> None:
     """Registers all handlers with the application."""
+    # Authorization runs first (group -1) and stops unauthorized updates for every handler below
+    application.add_handler(TypeHandler(Update, _auth_gate), group=-1)
+
     # Basic commands
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("upload", upload_excel_command))
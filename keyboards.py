@@ -2,21 +2,75 @@
 Functions to generate Inline Keyboards for the bot interactions.
 """
 
-from typing import List, Set
+import base64
+import binascii
+import functools
+import struct
+from typing import AbstractSet, FrozenSet, Sequence, Tuple
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 import config
 
+__all__ = [
+    "OP_GROUP_SELECT",
+    "OP_ATTENDANCE_TOGGLE",
+    "OP_ATTENDANCE_SAVE",
+    "pack_callback_data",
+    "unpack_callback_data",
+    "generate_group_selection_keyboard",
+    "generate_attendance_keyboard",
+    "generate_attendance_button",
+    "clear_keyboard_cache",
+]
 
-def generate_group_selection_keyboard(groups: List[str]) -> InlineKeyboardMarkup:
+# Callback operation codes, packed into the first byte of the callback data
+OP_GROUP_SELECT = 0
+OP_ATTENDANCE_TOGGLE = 1
+OP_ATTENDANCE_SAVE = 2
+
+# op (1 byte), group index, child index (2 bytes each) -> 7 base64 characters
+_CALLBACK_STRUCT = struct.Struct("<BHH")
+_CALLBACK_DATA_LEN = 7
+
+
+def pack_callback_data(op: int, group_index: int, child_index: int = 0) -> str:
+    """Packs a callback operation and its indices into a short base64 string."""
+    raw = _CALLBACK_STRUCT.pack(op, group_index, child_index)
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def unpack_callback_data(data: str) -> Tuple[int, int, int]:
+    """Unpacks callback data created by pack_callback_data into (op, group_index, child_index).
+
+    Raises:
+        ValueError: If the data was not produced by pack_callback_data
+            (e.g. a keyboard sent by an older version of the bot).
+    """
+    if len(data) != _CALLBACK_DATA_LEN:
+        raise ValueError(f"Unexpected callback data length: {len(data)}")
+    try:
+        raw = base64.b64decode(data + "=", altchars=b"-_", validate=True)
+    except binascii.Error as e:
+        raise ValueError(f"Malformed callback data: {data}") from e
+    return _CALLBACK_STRUCT.unpack(raw)
+
+
+def generate_group_selection_keyboard(groups: Sequence[str]) -> InlineKeyboardMarkup:
     """Generates an inline keyboard for selecting a group.
 
     The callback data uses the group's index instead of its name to
     keep the payload short (Telegram limits callback data to 64 bytes).
+    The group list only changes on upload, so the keyboard is cached.
     """
+    return _cached_group_selection_keyboard(tuple(groups))
+
+
+@functools.lru_cache(maxsize=4)
+def _cached_group_selection_keyboard(groups: Tuple[str, ...]) -> InlineKeyboardMarkup:
+    """Builds the group selection keyboard; see generate_group_selection_keyboard."""
     keyboard = [
-        [InlineKeyboardButton(group_name, callback_data=f"group_select:{idx}")]
+        [InlineKeyboardButton(group_name, callback_data=pack_callback_data(OP_GROUP_SELECT, idx))]
         for idx, group_name in enumerate(groups)
     ]
     return InlineKeyboardMarkup(keyboard)
@@ -25,29 +79,59 @@ def generate_group_selection_keyboard(groups: List[str]) -> InlineKeyboardMarkup
 def generate_attendance_keyboard(
     group_index: int,
     group_name: str,
-    children: List[str],
-    present_children: Set[str]
+    children: Sequence[str],
+    present_children: AbstractSet[str]
 ) -> InlineKeyboardMarkup:
     """Generates an inline keyboard for marking attendance for a specific group.
 
+    Keyboards are cached per (group, children, present set), so repeated states
+    reuse the same markup instead of rebuilding every button.
+
     Args:
         group_index: Index of the group in the sorted list of groups.
         group_name: The name of the group.
         children: A list of all children in the group.
         present_children: A set of children currently marked as present today.
     """
-    keyboard = []
-    for child_index, child_name in enumerate(children):
-        is_present = child_name in present_children
-        button_text = f"{config.CHECK_MARK_ICON} {child_name}" if is_present else child_name
-        # Use indices for callback data to avoid exceeding Telegram's 64-byte limit
-        callback_data = f"attendance_toggle:{group_index}:{child_index}"
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
+    return _cached_attendance_keyboard(group_index, group_name, tuple(children), frozenset(present_children))
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_attendance_keyboard(
+    group_index: int,
+    group_name: str,
+    children: Tuple[str, ...],
+    present_children: FrozenSet[str]
+) -> InlineKeyboardMarkup:
+    """Builds the attendance keyboard; see generate_attendance_keyboard."""
+    keyboard = [
+        [generate_attendance_button(group_index, child_index, child_name, child_name in present_children)]
+        for child_index, child_name in enumerate(children)
+    ]
 
     # Add Save button
     keyboard.append([
-        InlineKeyboardButton("💾 Сохранить", callback_data=f"attendance_save:{group_index}"),
+        InlineKeyboardButton("💾 Сохранить", callback_data=pack_callback_data(OP_ATTENDANCE_SAVE, group_index)),
         # InlineKeyboardButton("⬅️ Назад", callback_data="back_to_group_select") # Optional Back button
     ])
 
     return InlineKeyboardMarkup(keyboard)
+
+
+def generate_attendance_button(
+    group_index: int,
+    child_index: int,
+    child_name: str,
+    is_present: bool
+) -> InlineKeyboardButton:
+    """Generates the toggle button for a single child in the attendance keyboard."""
+    button_text = f"{config.CHECK_MARK_ICON} {child_name}" if is_present else child_name
+    # Use indices for callback data to avoid exceeding Telegram's 64-byte limit
+    callback_data = pack_callback_data(OP_ATTENDANCE_TOGGLE, group_index, child_index)
+    return InlineKeyboardButton(button_text, callback_data=callback_data)
+
+
+def clear_keyboard_cache() -> None:
+    """Drops cached keyboards, e.g. after a new groups file has been loaded."""
+    _cached_group_selection_keyboard.cache_clear()
+    _cached_attendance_keyboard.cache_clear()
@@ -3,14 +3,22 @@ Main entry point for the Telegram Attendance Bot.
 Initializes the bot, sets up logging, registers handlers, and starts polling.
 """
 
+import asyncio
 import logging
+import sys
 
-from telegram.ext import ApplicationBuilder
+try:
+    import uvloop
+except ImportError: # Optional: falls back to the default asyncio event loop
+    uvloop = None
+
+from telegram.ext import AIORateLimiter, ApplicationBuilder
 from telegram.warnings import PTBUserWarning
 import warnings
 
 import config
 import handlers
+import utils
 
 # --- Logging Configuration ---
 logging.basicConfig(
@@ -26,6 +34,13 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 
+async def post_init(application) -> None:
+    """Loads the groups and attendance data in a worker thread before polling starts."""
+    # Attendance is read lazily; touching it here keeps the JSON parse, the log replay
+    # and the compacting save off the event loop. Nothing else runs until polling starts.
+    await asyncio.to_thread(lambda: handlers.get_dm().attendance)
+
+
 def main() -> None:
     """Starts the bot."""
     logger.info("Starting bot...")
@@ -37,9 +52,31 @@ def main() -> None:
         logger.critical(f"Configuration error: {e}")
         return # Stop if config is invalid
 
+    # Create the data directories once up front so request handlers never have to
+    utils.ensure_dir_exists(config.DATA_DIR)
+    utils.ensure_dir_exists(config.REPORTS_DIR)
+
+    # libuv-based loop for faster socket I/O and timers; not available on Windows
+    if uvloop is not None and sys.platform != "win32":
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Using uvloop event loop.")
+
     # --- Bot Initialization ---
     # Using ApplicationBuilder for modern PTB setup
-    application = ApplicationBuilder().token(config.BOT_TOKEN).build()
+    application = (
+        ApplicationBuilder()
+        .token(config.BOT_TOKEN)
+        .connection_pool_size(config.CONNECTION_POOL_SIZE)
+        .pool_timeout(config.POOL_TIMEOUT)
+        .connect_timeout(config.CONNECT_TIMEOUT)
+        .read_timeout(config.READ_TIMEOUT)
+        .get_updates_connection_pool_size(config.GET_UPDATES_CONNECTION_POOL_SIZE)
+        .get_updates_pool_timeout(config.GET_UPDATES_POOL_TIMEOUT)
+        # Smooth out bursts of keyboard edits instead of running into Telegram's 429s
+        .rate_limiter(AIORateLimiter(max_retries=config.RATE_LIMITER_MAX_RETRIES))
+        .post_init(post_init)
+        .build()
+    )
 
     # --- Register Handlers ---
     handlers.register_handlers(application)
@@ -3,30 +3,63 @@ Utility functions for the Telegram bot.
 """
 
 import datetime
+import functools
+import logging
 import os
+import time
 from typing import Optional
 
 import config
 
+logger = logging.getLogger(__name__)
+
+
+# (timestamp of the next local midnight, today's date string)
+_date_cache = (0.0, "")
+
 
 def get_current_date_str() -> str:
-    """Returns the current date as a string in YYYY-MM-DD format."""
-    return datetime.date.today().isoformat()
+    """Returns the current date as a string in YYYY-MM-DD format.
+
+    The string is cached until the next local midnight, so most calls are a
+    single time.time() comparison.
+    """
+    global _date_cache
+    expires_at, date_str = _date_cache
+    if time.time() >= expires_at:
+        today = datetime.date.today()
+        next_midnight = datetime.datetime.combine(today + datetime.timedelta(days=1), datetime.time.min)
+        date_str = today.isoformat()
+        _date_cache = (next_midnight.timestamp(), date_str)
+    return date_str
 
 
+@functools.lru_cache(maxsize=32)
 def ensure_dir_exists(dir_path: str) -> None:
-    """Ensures that a directory exists, creating it if necessary."""
-    if not os.path.exists(dir_path):
-        try:
-            os.makedirs(dir_path)
-            print(f"Created directory: {dir_path}")
-        except OSError as e:
-            print(f"Error creating directory {dir_path}: {e}")
-            raise # Re-raise the exception if directory creation fails
+    """Ensures that a directory exists, creating it if necessary.
 
+    Only the first call per path touches the filesystem; later calls hit the cache.
+    """
+    try:
+        os.makedirs(dir_path, exist_ok=True)
+        logger.debug("Ensured directory exists: %s", dir_path)
+    except OSError as e:
+        logger.error("Error creating directory %s: %s", dir_path, e)
+        raise # Re-raise the exception if directory creation fails
 
+
+def read_file_bytes(file_path: str) -> bytes:
+    """Reads a whole file into memory using a 1 MiB buffer instead of the 8 KiB default."""
+    with open(file_path, 'rb', buffering=1024 * 1024) as f:
+        return f.read()
+
+
+@functools.lru_cache(maxsize=1024)
 def check_user_authorization(user_id: Optional[int]) -> bool:
-    """Checks if the user ID matches the allowed user ID."""
+    """Checks if the user ID matches the allowed user ID.
+
+    The allowed IDs are fixed at startup, so results are cached per user ID.
+    """
     if not user_id:
         return False
     return user_id in config.ALLOWED_USER_IDS